@@ -15,6 +15,17 @@ class Settings(BaseSettings):
    algorithm: str
    access_token_expire_minutes: int 
    database_url: str 
+   similarity_approximate_threshold: int = 50000
+   similarity_n_probe: int = 8
+   # Characters with their own column in the similarity index; the rest are hashed into
+   # similarity_hash_buckets shared columns. The index holds about
+   # rows * (similarity_max_characters + similarity_hash_buckets) * 4 bytes, ~102 MB for 50k rows
+   # at the defaults, and up to twice that while row capacity is doubling.
+   similarity_max_characters: int = 256
+   similarity_hash_buckets: int = 256
+   # Comma-separated database URLs, one per hash partition; empty uses database_url settings above
+   database_partition_urls: str = ""
+   database_partition_workers: int = 8
     
    
    class Config:
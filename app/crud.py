@@ -1,22 +1,64 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, Integer, Text  # Add Integer import here
+from sqlalchemy import and_, or_, delete, func, literal, select, true, union_all, Integer, Text  # Add Integer import here
 from typing import List, Optional, Dict
-from . import models, schemas
+from . import models, schemas, analyzers
+from .partitioning import DB, fan_out, group_by_partition, session_for_hash, sessions_of
+import heapq
+import itertools
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Every paginated read uses this order, so pages are stable and partitioned
+# reads can merge per-partition pages into the same result as one database
+PARTITION_ORDER = (models.StringAnalysis.created_at, models.StringAnalysis.id)
+
+def _hash_for_value(value: str) -> str:
+    # Rows are keyed by the hash of the stripped value, see StringAnalyzer.analyze_string
+    return analyzers.StringAnalyzer.generate_id(value.strip())
+
 class StringAnalysisCRUD:
     @staticmethod
-    def get_analysis_by_value(db: Session, value: str):
-        return db.query(models.StringAnalysis).filter(models.StringAnalysis.value == value).first()
+    def get_analysis_by_value(db: DB, value: str):
+        session = session_for_hash(db, _hash_for_value(value))
+        return session.query(models.StringAnalysis).filter(models.StringAnalysis.value == value).first()
+    
+    @staticmethod
+    def get_analysis_by_hash(db: DB, sha256_hash: str):
+        session = session_for_hash(db, sha256_hash)
+        return session.query(models.StringAnalysis).filter(models.StringAnalysis.sha256_hash == sha256_hash).first()
+    
+    @staticmethod
+    def get_analyses_by_ids(db: DB, ids: List[str]):
+        if not ids:
+            return []
+        groups = group_by_partition(db, ids, lambda analysis_id: analysis_id)
+        results = fan_out(
+            db,
+            lambda session: session.query(models.StringAnalysis).filter(models.StringAnalysis.id.in_(groups[session])).all(),
+            sessions=list(groups)
+        )
+        return [analysis for analyses in results for analysis in analyses]
+    
+    @staticmethod
+    def count_analyses(db: DB) -> int:
+        return sum(fan_out(db, lambda session: session.query(models.StringAnalysis).count()))
     
     @staticmethod
-    def get_analysis_by_hash(db: Session, sha256_hash: str):
-        return db.query(models.StringAnalysis).filter(models.StringAnalysis.sha256_hash == sha256_hash).first()
+    def get_frequency_maps(db: DB):
+        """All ``(id, character_frequency_map)`` pairs, without loading full rows"""
+        results = fan_out(
+            db,
+            lambda session: session.query(
+                models.StringAnalysis.id,
+                models.StringAnalysis.character_frequency_map
+            ).all()
+        )
+        return [row for rows in results for row in rows]
     
     @staticmethod
-    def create_analysis(db: Session, value: str, properties: Dict):
+    def create_analysis(db: DB, value: str, properties: Dict):
+        db = session_for_hash(db, properties["sha256_hash"])
         analysis_id = properties["sha256_hash"]
         db_analysis = models.StringAnalysis(
             id=analysis_id,
@@ -34,53 +76,240 @@ class StringAnalysisCRUD:
         return db_analysis
     
     @staticmethod
-    def get_all_analyses(
-        db: Session,
-        skip: int = 0,
-        limit: int = 100,
+    def _filter_conditions(
         is_palindrome: Optional[bool] = None,
         min_length: Optional[int] = None,
         max_length: Optional[int] = None,
         word_count: Optional[int] = None,
         contains_character: Optional[str] = None,
         contains_text: Optional[str] = None  ):
+        """Translate the shared filter set into SQL conditions"""
+        conditions = []
         
-        query = db.query(models.StringAnalysis)
-        
-        print(f"🔍 CRUD called with filters: {locals()}")
-        
-        # Existing filters...
         if is_palindrome is not None:
-            query = query.filter(models.StringAnalysis.is_palindrome == is_palindrome)
+            conditions.append(models.StringAnalysis.is_palindrome == is_palindrome)
         
         if min_length is not None:
-            query = query.filter(models.StringAnalysis.length >= min_length)
+            conditions.append(models.StringAnalysis.length >= min_length)
             
         if max_length is not None:
-            query = query.filter(models.StringAnalysis.length <= max_length)
+            conditions.append(models.StringAnalysis.length <= max_length)
             
         if word_count is not None:
-            query = query.filter(models.StringAnalysis.word_count == word_count)
+            conditions.append(models.StringAnalysis.word_count == word_count)
             
         if contains_character is not None and len(contains_character) == 1:
-            query = query.filter(
+            conditions.append(
                 models.StringAnalysis.character_frequency_map[contains_character].isnot(None)
             )
         
-        # NEW: Handle text content search
+        # Handle text content search
         if contains_text is not None:
-            query = query.filter(models.StringAnalysis.value.contains(contains_text))
+            conditions.append(models.StringAnalysis.value.contains(contains_text))
+        
+        return conditions
+    
+    @staticmethod
+    def get_all_analyses(
+        db: DB,
+        skip: int = 0,
+        limit: int = 100,
+        is_palindrome: Optional[bool] = None,
+        min_length: Optional[int] = None,
+        max_length: Optional[int] = None,
+        word_count: Optional[int] = None,
+        contains_character: Optional[str] = None,
+        contains_text: Optional[str] = None  ):
+        
+        print(f"🔍 CRUD called with filters: {locals()}")
+        
+        conditions = StringAnalysisCRUD._filter_conditions(
+            is_palindrome=is_palindrome,
+            min_length=min_length,
+            max_length=max_length,
+            word_count=word_count,
+            contains_character=contains_character,
+            contains_text=contains_text
+        )
         
-        total_count = query.count()
-        analyses = query.offset(skip).limit(limit).all()
+        sessions = sessions_of(db)
+        if len(sessions) == 1:
+            query = sessions[0].query(models.StringAnalysis).filter(*conditions)
+            total_count = query.count()
+            analyses = query.order_by(*PARTITION_ORDER).offset(skip).limit(limit).all()
+            return analyses, total_count
         
-        return analyses, total_count
+        # Each partition returns only the (created_at, id) keys of its first
+        # skip + limit rows, which is enough to cut the global page out of the
+        # merged key stream; only the rows on that page are then loaded
+        def partition_keys(session):
+            query = session.query(models.StringAnalysis).filter(*conditions)
+            keys = query.with_entities(*PARTITION_ORDER).order_by(*PARTITION_ORDER).limit(skip + limit).all()
+            return [tuple(key) for key in keys], query.count()
+        
+        pages = fan_out(db, partition_keys)
+        total_count = sum(count for _, count in pages)
+        page_keys = list(itertools.islice(heapq.merge(*[keys for keys, _ in pages]), skip, skip + limit))
+        
+        analyses = {
+            analysis.id: analysis
+            for analysis in StringAnalysisCRUD.get_analyses_by_ids(db, [analysis_id for _, analysis_id in page_keys])
+        }
+        return [analyses[analysis_id] for _, analysis_id in page_keys if analysis_id in analyses], total_count
+    
+    @staticmethod
+    def get_analyses_for_filter_sets(
+        db: DB,
+        filter_sets: List[Dict],
+        skip: int = 0,
+        limit: int = 100
+    ):
+        """Run many filter sets with one shared count scan, one UNION ALL key query and one row load.
+        
+        Returns the total number of stored strings and, for each filter set,
+        the same ``(analyses, total_count)`` pair as ``get_all_analyses``.
+        """
+        if not filter_sets:
+            return 0, []
+        
+        conditions = [
+            and_(true(), *StringAnalysisCRUD._filter_conditions(**filters))
+            for filters in filter_sets
+        ]
+        
+        sessions = sessions_of(db)
+        if len(sessions) == 1:
+            total_strings, key_pages = StringAnalysisCRUD._filter_set_keys(sessions[0], conditions, skip, limit)
+        else:
+            # As in get_all_analyses, partitions return only the keys of their first
+            # skip + limit rows per filter set and the merged keys pick each page
+            results = fan_out(
+                db,
+                lambda session: StringAnalysisCRUD._filter_set_keys(session, conditions, 0, skip + limit)
+            )
+            total_strings = sum(partition_total for partition_total, _ in results)
+            key_pages = []
+            for index in range(len(filter_sets)):
+                partition_pages = [partition_key_pages[index] for _, partition_key_pages in results]
+                merged = heapq.merge(*[keys for keys, _ in partition_pages])
+                key_pages.append((
+                    list(itertools.islice(merged, skip, skip + limit)),
+                    sum(count for _, count in partition_pages)
+                ))
+        
+        # Load every row on any of the pages with one IN query per partition
+        analyses = {
+            analysis.id: analysis
+            for analysis in StringAnalysisCRUD.get_analyses_by_ids(
+                db, list({analysis_id for keys, _ in key_pages for _, analysis_id in keys})
+            )
+        }
+        
+        return total_strings, [
+            ([analyses[analysis_id] for _, analysis_id in keys if analysis_id in analyses], count)
+            for keys, count in key_pages
+        ]
+    
+    @staticmethod
+    def _filter_set_keys(session: Session, conditions, skip: int, limit: int):
+        # One scan counts the whole table and every filter set at once
+        counts = session.query(
+            func.count(),
+            *[func.count().filter(condition) for condition in conditions]
+        ).select_from(models.StringAnalysis).one()
+        total_strings, filter_counts = counts[0], counts[1:]
+        
+        pages = []
+        for index, condition in enumerate(conditions):
+            if filter_counts[index] <= skip:
+                continue
+            pages.append(
+                select(literal(index, Integer).label("batch_index"), *PARTITION_ORDER)
+                .where(condition)
+                .order_by(*PARTITION_ORDER)
+                .offset(skip)
+                .limit(limit)
+                .subquery()
+                .select()
+            )
+        
+        page_keys: List[List] = [[] for _ in conditions]
+        if pages:
+            for index, created_at, analysis_id in session.execute(union_all(*pages)).all():
+                page_keys[index].append((created_at, analysis_id))
+        
+        # UNION ALL does not keep each branch's ORDER BY
+        return total_strings, [
+            (sorted(keys), filter_counts[index])
+            for index, keys in enumerate(page_keys)
+        ]
+    
+    @staticmethod
+    def get_analyses_by_values_or_hashes(db: DB, values: List[str], hashes: List[str]):
+        """Resolve many values and hashes with a single IN query per partition"""
+        groups = StringAnalysisCRUD._selectors_by_partition(db, values, hashes)
+        results = fan_out(
+            db,
+            lambda session: session.query(models.StringAnalysis).filter(groups[session]).all(),
+            sessions=list(groups)
+        )
+        return [analysis for analyses in results for analysis in analyses]
+    
+    @staticmethod
+    def delete_analysis(db: DB, value: str):
+        session = session_for_hash(db, _hash_for_value(value))
+        deleted_ids = StringAnalysisCRUD._delete_where(session, [models.StringAnalysis.value == value])
+        return deleted_ids[0] if deleted_ids else None
+    
+    @staticmethod
+    def bulk_delete_analyses(
+        db: DB,
+        values: Optional[List[str]] = None,
+        hashes: Optional[List[str]] = None,
+        **filters
+    ) -> List[str]:
+        """Delete rows matching any of the values/hashes and all of the filters"""
+        conditions = StringAnalysisCRUD._filter_conditions(**filters)
+        
+        if values or hashes:
+            # Only partitions owning one of the values/hashes can match
+            groups = StringAnalysisCRUD._selectors_by_partition(db, values or [], hashes or [])
+            results = fan_out(
+                db,
+                lambda session: StringAnalysisCRUD._delete_where(session, conditions + [groups[session]]),
+                sessions=list(groups)
+            )
+        else:
+            if not conditions:
+                raise ValueError("Refusing to delete without values, hashes or filters")
+            results = fan_out(db, lambda session: StringAnalysisCRUD._delete_where(session, conditions))
+        
+        return [analysis_id for deleted_ids in results for analysis_id in deleted_ids]
     
     @staticmethod
-    def delete_analysis(db: Session, value: str):
-        analysis = db.query(models.StringAnalysis).filter(models.StringAnalysis.value == value).first()
-        if analysis:
-            db.delete(analysis)
-            db.commit()
-            return True
-        return False
\ No newline at end of file
+    def _selectors_by_partition(db: DB, values: List[str], hashes: List[str]):
+        # Route each value/hash to its partition and OR together the IN lists there
+        value_groups = group_by_partition(db, values, _hash_for_value)
+        hash_groups = group_by_partition(db, hashes, lambda sha256_hash: sha256_hash)
+        groups = {}
+        for session in {**value_groups, **hash_groups}:
+            selectors = []
+            if session in value_groups:
+                selectors.append(models.StringAnalysis.value.in_(value_groups[session]))
+            if session in hash_groups:
+                selectors.append(models.StringAnalysis.sha256_hash.in_(hash_groups[session]))
+            groups[session] = or_(*selectors)
+        return groups
+    
+    @staticmethod
+    def _delete_where(db: Session, conditions) -> List[str]:
+        # One set-based DELETE ... RETURNING id instead of loading ORM objects
+        statement = (
+            delete(models.StringAnalysis)
+            .where(and_(*conditions))
+            .returning(models.StringAnalysis.id)
+            .execution_options(synchronize_session=False)
+        )
+        deleted_ids = list(db.execute(statement).scalars())
+        db.commit()
+        return deleted_ids
\ No newline at end of file
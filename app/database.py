@@ -1,17 +1,34 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 from .config import settings
+from .partitioning import PartitionedSession
 
 SQLALCHEMY_DATABASE_URL = f'postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}/{settings.database_name}' 
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Optional hash partitions, e.g. several SQLite files locally or Postgres databases in production
+PARTITION_URLS = [url.strip() for url in settings.database_partition_urls.split(",") if url.strip()]
+partition_engines = [
+    create_engine(url, connect_args={"check_same_thread": False} if url.startswith("sqlite") else {})
+    for url in PARTITION_URLS
+]
+PartitionSessionLocals = [
+    sessionmaker(autocommit=False, autoflush=False, bind=partition_engine)
+    for partition_engine in partition_engines
+]
+partition_executor = ThreadPoolExecutor(max_workers=settings.database_partition_workers) if partition_engines else None
+
 def get_db():
-    db = SessionLocal()
+    if PartitionSessionLocals:
+        db = PartitionedSession(PartitionSessionLocals, partition_executor)
+    else:
+        db = SessionLocal()
     try:
         yield db
     finally:
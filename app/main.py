@@ -1,13 +1,18 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Query
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
 from typing import Optional, List
+import logging
 
-from . import models, schemas, crud, analyzers, natural_language
-from .database import engine, get_db
+from . import models, schemas, crud, analyzers, natural_language, similarity
+from .database import engine, partition_engines, get_db
+# get_db may yield a PartitionedSession, so handlers go through StringAnalysisCRUD
+from .partitioning import DB
+
+logger = logging.getLogger(__name__)
 
 # Create database tables
-models.Base.metadata.create_all(bind=engine)
+for table_engine in partition_engines or [engine]:
+    models.Base.metadata.create_all(bind=table_engine)
 
 app = FastAPI(
     title="String Analyzer Service",
@@ -31,7 +36,7 @@ def root():
 @app.post("/strings", response_model=schemas.StringAnalysisResponse, status_code=status.HTTP_201_CREATED)
 def create_analyze_string(
     string_data: schemas.StringAnalysisCreate,
-    db: Session = Depends(get_db)
+    db: DB = Depends(get_db)
 ):
     """Create and analyze a new string"""
     # Check if string already exists
@@ -47,6 +52,7 @@ def create_analyze_string(
     
     # Create analysis record
     analysis = crud.StringAnalysisCRUD.create_analysis(db, string_data.value, properties)
+    similarity.character_index.add(analysis.id, analysis.character_frequency_map)
     
     return {
         "id": analysis.id,
@@ -63,12 +69,78 @@ def create_analyze_string(
     }
 
 
+@app.post("/strings/lookup", response_model=schemas.StringLookupResponse)
+def lookup_strings(
+    lookup: schemas.StringLookupRequest,
+    db: DB = Depends(get_db)
+):
+    """Get analyses for many values and/or SHA256 hashes at once"""
+    analyses = crud.StringAnalysisCRUD.get_analyses_by_values_or_hashes(db, lookup.values, lookup.hashes)
+    
+    found_values = {analysis.value for analysis in analyses}
+    found_hashes = {analysis.sha256_hash for analysis in analyses}
+    
+    return {
+        "data": [
+            {
+                "id": analysis.id,
+                "value": analysis.value,
+                "properties": {
+                    "length": analysis.length,
+                    "is_palindrome": analysis.is_palindrome,
+                    "unique_characters": analysis.unique_characters,
+                    "word_count": analysis.word_count,
+                    "sha256_hash": analysis.sha256_hash,
+                    "character_frequency_map": analysis.character_frequency_map
+                },
+                "created_at": analysis.created_at
+            }
+            for analysis in analyses
+        ],
+        "count": len(analyses),
+        "not_found": {
+            "values": [value for value in lookup.values if value not in found_values],
+            "hashes": [sha256_hash for sha256_hash in lookup.hashes if sha256_hash not in found_hashes]
+        }
+    }
+
+
+@app.post("/strings/bulk-delete", response_model=schemas.BulkDeleteResponse)
+def bulk_delete_strings(
+    request: schemas.BulkDeleteRequest,
+    db: DB = Depends(get_db)
+):
+    """Delete every string matching any given value/hash and all given filters"""
+    filters = request.filters.model_dump(exclude_none=True) if request.filters else {}
+    
+    if not request.values and not request.hashes and not filters:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide values, hashes or at least one filter"
+        )
+    
+    if filters.get('min_length') is not None and filters.get('max_length') is not None and filters['min_length'] > filters['max_length']:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="min_length cannot be greater than max_length"
+        )
+    
+    deleted_ids = crud.StringAnalysisCRUD.bulk_delete_analyses(
+        db,
+        values=request.values,
+        hashes=request.hashes,
+        **filters
+    )
+    similarity.character_index.remove_many(deleted_ids)
+    
+    return {"count": len(deleted_ids)}
+
 @app.get("/strings/filter-by-natural-language", response_model=schemas.NaturalLanguageResponse)
 def filter_by_natural_language(
     query: str = Query(..., description="Natural language query string"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db)
+    db: DB = Depends(get_db)
 ):
     """Filter strings using natural language queries"""
     try:
@@ -85,7 +157,7 @@ def filter_by_natural_language(
             )
         
         # Check if we have any strings in the database at all
-        total_strings = db.query(models.StringAnalysis).count()
+        total_strings = crud.StringAnalysisCRUD.count_analyses(db)
         print(f"📊 Total strings in database: {total_strings}")
         
         if total_strings == 0:
@@ -150,9 +222,144 @@ def filter_by_natural_language(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Unable to parse natural language query: {str(e)}"
         )
+
+@app.post("/strings/filter-by-natural-language/batch", response_model=schemas.NaturalLanguageBatchResponse)
+def filter_by_natural_language_batch(
+    batch: schemas.NaturalLanguageBatchRequest,
+    db: DB = Depends(get_db)
+):
+    """Filter strings using many natural language queries in one round trip"""
+    parsed = {}
+    distinct_filters = {}
+    for query in batch.queries:
+        if query in parsed:
+            continue
+        try:
+            filters = natural_language.NaturalLanguageParser.parse_query(query)
+        except Exception as e:
+            parsed[query] = (None, f"Unable to parse natural language query: {str(e)}")
+            continue
+        if not natural_language.NaturalLanguageParser.validate_filters(filters):
+            parsed[query] = (filters, "Query parsed but resulted in conflicting filters")
+            continue
+        # Queries that parse to the same filters share one execution
+        key = tuple(sorted(filters.items()))
+        distinct_filters.setdefault(key, filters)
+        parsed[query] = (filters, None)
+    
+    logger.info(f"🎯 Batch of {len(batch.queries)} queries -> {len(distinct_filters)} distinct filter sets")
+    
+    keys = list(distinct_filters)
+    total_strings, results = crud.StringAnalysisCRUD.get_analyses_for_filter_sets(
+        db=db,
+        filter_sets=[distinct_filters[key] for key in keys],
+        skip=batch.skip,
+        limit=batch.limit
+    )
+    results_by_key = dict(zip(keys, results))
+    
+    response_results = []
+    for query in batch.queries:
+        filters, error = parsed[query]
+        interpreted_query = {
+            "original": query,
+            "parsed_filters": filters
+        }
+        if error is not None:
+            response_results.append({
+                "data": [],
+                "count": 0,
+                "interpreted_query": interpreted_query,
+                "error": error
+            })
+            continue
+        
+        analyses, total_count = results_by_key[tuple(sorted(filters.items()))]
+        if total_strings == 0:
+            interpreted_query["note"] = "No strings in database"
+        response_results.append({
+            "data": [
+                {
+                    "id": analysis.id,
+                    "value": analysis.value,
+                    "properties": {
+                        "length": analysis.length,
+                        "is_palindrome": analysis.is_palindrome,
+                        "unique_characters": analysis.unique_characters,
+                        "word_count": analysis.word_count,
+                        "sha256_hash": analysis.sha256_hash,
+                        "character_frequency_map": analysis.character_frequency_map
+                    },
+                    "created_at": analysis.created_at
+                }
+                for analysis in analyses
+            ],
+            "count": total_count,
+            "interpreted_query": interpreted_query
+        })
+    
+    return {
+        "results": response_results,
+        "count": len(response_results)
+    }
+
+
+@app.get("/strings/similar", response_model=schemas.SimilarStringsResponse)
+def get_similar_strings(
+    query: str = Query(..., min_length=1, max_length=10000, description="String to compare against stored strings"),
+    k: int = Query(10, ge=1, le=100, description="Number of closest strings to return"),
+    metric: str = Query("cosine", pattern="^(cosine|l1)$", description="Distance metric: cosine or l1"),
+    exact: bool = Query(False, description="Always score every stored string, even on large tables"),
+    db: DB = Depends(get_db)
+):
+    """Find stored strings with the closest character distribution"""
+    char_freq = analyzers.StringAnalyzer.analyze_string(query)["character_frequency_map"]
+    if not char_freq:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Query must contain at least one non-whitespace character"
+        )
+    
+    matches, approximate = similarity.character_index.query(db, char_freq, k=k, metric=metric, exact=exact)
+    
+    analyses = {
+        analysis.id: analysis
+        for analysis in crud.StringAnalysisCRUD.get_analyses_by_ids(db, [analysis_id for analysis_id, _ in matches])
+    }
+    
+    data = []
+    for analysis_id, score in matches:
+        analysis = analyses.get(analysis_id)
+        if analysis is None:
+            continue
+        data.append({
+            "id": analysis.id,
+            "value": analysis.value,
+            "properties": {
+                "length": analysis.length,
+                "is_palindrome": analysis.is_palindrome,
+                "unique_characters": analysis.unique_characters,
+                "word_count": analysis.word_count,
+                "sha256_hash": analysis.sha256_hash,
+                "character_frequency_map": analysis.character_frequency_map
+            },
+            "created_at": analysis.created_at,
+            "score": score
+        })
+    
+    return {
+        "data": data,
+        "count": len(data),
+        "query": {
+            "value": query,
+            "k": k,
+            "metric": metric,
+            "approximate": approximate
+        }
+    }
         
 @app.get("/strings/{string_value}", response_model=schemas.StringAnalysisResponse)
-def get_string(string_value: str, db: Session = Depends(get_db)):
+def get_string(string_value: str, db: DB = Depends(get_db)):
     """Get analysis for a specific string"""
     analysis = crud.StringAnalysisCRUD.get_analysis_by_value(db, string_value)
     if not analysis:
@@ -184,7 +391,7 @@ def get_all_strings(
     contains_character: Optional[str] = Query(None, min_length=1, max_length=1, description="Single character to search for"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db)
+    db: DB = Depends(get_db)
 ):
     """Get all strings with optional filtering"""
     # Validate min_length and max_length
@@ -241,14 +448,16 @@ def get_all_strings(
 
            
 @app.delete("/strings/{string_value}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_string(string_value: str, db: Session = Depends(get_db)):
+def delete_string(string_value: str, db: DB = Depends(get_db)):
     """Delete a string analysis"""
-    if not crud.StringAnalysisCRUD.delete_analysis(db, string_value):
+    analysis_id = crud.StringAnalysisCRUD.delete_analysis(db, string_value)
+    if not analysis_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="String does not exist in the system"
         )
     
+    similarity.character_index.remove(analysis_id)
     return None
 
 @app.get("/health")
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, TypeVar, Union
+
+from sqlalchemy.orm import Session, sessionmaker
+
+T = TypeVar("T")
+K = TypeVar("K")
+
+
+def partition_for_hash(sha256_hash: str, partition_count: int) -> int:
+    """Map a SHA256 hex digest to a partition using its first 8 hex characters"""
+    return int(sha256_hash[:8], 16) % partition_count
+
+
+class PartitionedSession:
+    """One session per hash partition, plus a thread pool to query them in parallel"""
+
+    def __init__(self, session_factories: Sequence[sessionmaker], executor: ThreadPoolExecutor):
+        self.sessions: List[Session] = [factory() for factory in session_factories]
+        self._executor = executor
+
+    def session_for_hash(self, sha256_hash: str) -> Session:
+        return self.sessions[partition_for_hash(sha256_hash, len(self.sessions))]
+
+    def map(self, fn: Callable[[Session], T], sessions: Optional[List[Session]] = None) -> List[T]:
+        sessions = self.sessions if sessions is None else sessions
+        if len(sessions) == 1:
+            return [fn(sessions[0])]
+        return list(self._executor.map(fn, sessions))
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
+
+
+DB = Union[Session, PartitionedSession]
+
+
+def sessions_of(db: DB) -> List[Session]:
+    """All sessions a query has to visit"""
+    if isinstance(db, PartitionedSession):
+        return db.sessions
+    return [db]
+
+
+def session_for_hash(db: DB, sha256_hash: str) -> Session:
+    """The single session holding the row with this hash"""
+    if isinstance(db, PartitionedSession):
+        return db.session_for_hash(sha256_hash)
+    return db
+
+
+def fan_out(db: DB, fn: Callable[[Session], T], sessions: Optional[List[Session]] = None) -> List[T]:
+    """Run ``fn`` once per session, in parallel when there is more than one"""
+    if isinstance(db, PartitionedSession):
+        return db.map(fn, sessions)
+    return [fn(session) for session in (sessions_of(db) if sessions is None else sessions)]
+
+
+def group_by_partition(db: DB, keys: Iterable[K], hash_of: Callable[[K], str]) -> Dict[Session, List[K]]:
+    """Bucket keys by the session their hash routes to"""
+    groups: Dict[Session, List[K]] = {}
+    for key in keys:
+        groups.setdefault(session_for_hash(db, hash_of(key)), []).append(key)
+    return groups
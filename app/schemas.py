@@ -1,7 +1,10 @@
-from pydantic import BaseModel, Field
-from typing import Dict, Optional, Any
+from pydantic import BaseModel, Field, StringConstraints
+from typing import Annotated, Dict, Optional, Any
 from datetime import datetime
 
+# Lowercase hex SHA256 digest, as stored in sha256_hash
+Sha256Hash = Annotated[str, StringConstraints(pattern=r"^[0-9a-f]{64}$")]
+
 class StringProperties(BaseModel):
     length: int
     is_palindrome: bool
@@ -24,10 +27,55 @@ class StringListResponse(BaseModel):
     count: int
     filters_applied: Dict[str, Any]
 
+class StringFilters(BaseModel):
+    is_palindrome: Optional[bool] = None
+    min_length: Optional[int] = Field(None, ge=0)
+    max_length: Optional[int] = Field(None, ge=0)
+    word_count: Optional[int] = Field(None, ge=0)
+    contains_character: Optional[str] = Field(None, min_length=1, max_length=1)
+    contains_text: Optional[str] = Field(None, min_length=1)
+
+class StringLookupRequest(BaseModel):
+    values: list[str] = Field(default_factory=list, max_length=1000)
+    hashes: list[Sha256Hash] = Field(default_factory=list, max_length=1000)
+
+class StringLookupResponse(BaseModel):
+    data: list[StringAnalysisResponse]
+    count: int
+    not_found: Dict[str, list[str]]
+
+class BulkDeleteRequest(BaseModel):
+    values: list[str] = Field(default_factory=list, max_length=10000)
+    hashes: list[Sha256Hash] = Field(default_factory=list, max_length=10000)
+    filters: Optional[StringFilters] = None
+
+class BulkDeleteResponse(BaseModel):
+    count: int
+
 class NaturalLanguageQuery(BaseModel):
     query: str = Field(..., min_length=1, max_length=500)
 
 class NaturalLanguageResponse(BaseModel):
     data: list[StringAnalysisResponse]
     count: int
-    interpreted_query: Dict[str, Any]
\ No newline at end of file
+    interpreted_query: Dict[str, Any]
+
+class SimilarStringResponse(StringAnalysisResponse):
+    score: float
+
+class SimilarStringsResponse(BaseModel):
+    data: list[SimilarStringResponse]
+    count: int
+    query: Dict[str, Any]
+
+class NaturalLanguageBatchRequest(BaseModel):
+    queries: list[str] = Field(..., min_length=1, max_length=100)
+    skip: int = Field(0, ge=0)
+    limit: int = Field(100, ge=1, le=1000)
+
+class NaturalLanguageBatchResult(NaturalLanguageResponse):
+    error: Optional[str] = None
+
+class NaturalLanguageBatchResponse(BaseModel):
+    results: list[NaturalLanguageBatchResult]
+    count: int
\ No newline at end of file
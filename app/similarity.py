@@ -0,0 +1,329 @@
+import threading
+import logging
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import crud
+from .partitioning import DB
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("cosine", "l1")
+
+
+class CharacterFrequencyIndex:
+    """In-memory index of normalized character frequency vectors.
+
+    Each stored string is kept as one row of a dense matrix holding its
+    character distribution (counts divided by length). Only the
+    ``max_characters`` most common characters get their own column; any
+    other character is hashed into one of ``hash_buckets`` shared columns,
+    so memory stays at about ``rows * (max_characters + hash_buckets) * 4``
+    bytes while rare characters still mostly land apart. Queries are scored
+    against all rows at once with NumPy; once the index grows past
+    ``approximate_threshold`` rows, queries only score the rows in the
+    ``n_probe`` partitions whose centroids are closest to the query.
+    """
+
+    _BLOCK_ROWS = 4096
+    _KMEANS_ITERATIONS = 10
+    _KMEANS_SAMPLE_PER_PARTITION = 64
+
+    def __init__(
+        self,
+        approximate_threshold: int = 50000,
+        n_probe: int = 8,
+        max_characters: int = 256,
+        hash_buckets: int = 256
+    ):
+        self.approximate_threshold = approximate_threshold
+        self.n_probe = n_probe
+        self.max_characters = max_characters
+        # Columns [0, hash_buckets) are hashed buckets, vocabulary columns follow
+        self.hash_buckets = max(1, hash_buckets)
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._loaded = False
+        self._columns: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._centroids: Optional[np.ndarray] = None
+        self._partitions = np.zeros(0, dtype=np.int32)
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def ensure_loaded(self, db: DB) -> None:
+        """Build the index from the database on first use"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            rows = crud.StringAnalysisCRUD.get_frequency_maps(db)
+            # Give columns to the characters used by the most strings
+            document_frequency = Counter(char for _, char_freq in rows for char in char_freq)
+            for char, _ in document_frequency.most_common(self.max_characters):
+                self._columns[char] = self.hash_buckets + len(self._columns)
+            for analysis_id, char_freq in rows:
+                self._add(analysis_id, char_freq)
+            self._loaded = True
+            logger.info(f"📐 Loaded {len(rows)} strings into similarity index")
+
+    def add(self, analysis_id: str, char_freq: Dict[str, int]) -> None:
+        """Insert or replace the vector for a stored string"""
+        with self._lock:
+            # Before the first load the database is the source of truth
+            if self._loaded:
+                self._add(analysis_id, char_freq)
+
+    def remove(self, analysis_id: str) -> None:
+        """Drop the vector for a deleted string"""
+        with self._lock:
+            if self._loaded:
+                self._remove(analysis_id)
+
+    def remove_many(self, analysis_ids: List[str]) -> None:
+        """Drop the vectors for a batch of deleted strings"""
+        with self._lock:
+            if not self._loaded:
+                return
+            if len(analysis_ids) * 2 >= len(self._ids):
+                # Cheaper to rebuild from what is left than to move rows one by one
+                self._reset()
+                return
+            for analysis_id in analysis_ids:
+                self._remove(analysis_id)
+
+    def clear(self) -> None:
+        """Forget all vectors; the next query reloads from the database"""
+        with self._lock:
+            self._reset()
+
+    def query(
+        self,
+        db: DB,
+        char_freq: Dict[str, int],
+        k: int = 10,
+        metric: str = "cosine",
+        exact: bool = False
+    ) -> Tuple[List[Tuple[str, float]], bool]:
+        """Return the ``k`` closest stored ids with their scores.
+
+        Loading happens under the same lock as scoring, so a reset from a
+        large bulk delete cannot leave the query looking at an empty index.
+
+        Scores are similarities in [0, 1], higher meaning closer: cosine
+        similarity, or ``1 - L1 / 2`` for the L1 metric. The second element
+        of the result tells whether the partitioned index was used.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}'")
+
+        with self._lock:
+            self.ensure_loaded(db)
+            size = len(self._ids)
+            if size == 0:
+                return [], False
+
+            query_vector, unknown_mass = self._query_vector(char_freq)
+
+            approximate = not exact and size >= self.approximate_threshold
+            if approximate:
+                self._ensure_partitions()
+                candidates = self._candidate_rows(query_vector)
+            else:
+                candidates = np.arange(size)
+            if len(candidates) == 0:
+                return [], approximate
+
+            scores = np.empty(len(candidates), dtype=np.float32)
+            for start in range(0, len(candidates), self._BLOCK_ROWS):
+                block = candidates[start:start + self._BLOCK_ROWS]
+                scores[start:start + len(block)] = self._score(
+                    block, query_vector, unknown_mass, metric
+                )
+
+            k = min(k, len(candidates))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return [
+                (self._ids[candidates[i]], float(scores[i])) for i in top
+            ], approximate
+
+    def _query_vector(self, char_freq: Dict[str, int]) -> Tuple[np.ndarray, float]:
+        total = sum(char_freq.values())
+        vector = np.zeros(self._matrix.shape[1], dtype=np.float32)
+        unknown_mass = 0.0
+        if total == 0:
+            return vector, unknown_mass
+        vocabulary_full = len(self._columns) >= self.max_characters
+        for char, count in char_freq.items():
+            column = self._columns.get(char)
+            if column is not None:
+                vector[column] = count / total
+            elif vocabulary_full:
+                # Stored strings may hold this character in its hashed bucket too
+                vector[self._bucket_for(char)] += count / total
+            else:
+                # Characters no stored string uses still count toward the norm
+                unknown_mass += count / total
+        return vector, unknown_mass
+
+    def _score(
+        self,
+        rows: np.ndarray,
+        query_vector: np.ndarray,
+        unknown_mass: float,
+        metric: str
+    ) -> np.ndarray:
+        block = self._matrix[rows]
+        if metric == "cosine":
+            query_norm = np.sqrt(np.dot(query_vector, query_vector) + unknown_mass ** 2)
+            denominator = self._norms[rows] * query_norm
+            scores = np.divide(
+                block @ query_vector,
+                denominator,
+                out=np.zeros(len(rows), dtype=np.float32),
+                where=denominator > 0
+            )
+        else:
+            distance = np.abs(block - query_vector).sum(axis=1) + unknown_mass
+            scores = 1.0 - distance / 2.0
+        # float32 rounding can step just outside the documented range
+        return np.clip(scores, 0.0, 1.0)
+
+    def _bucket_for(self, char: str) -> int:
+        # crc32 rather than hash() so buckets do not depend on PYTHONHASHSEED
+        return zlib.crc32(char.encode("utf-8", "surrogatepass")) % self.hash_buckets
+
+    def _column_for(self, char: str) -> int:
+        column = self._columns.get(char)
+        if column is None:
+            if len(self._columns) >= self.max_characters:
+                return self._bucket_for(char)
+            column = self._columns[char] = self.hash_buckets + len(self._columns)
+        return column
+
+    def _add(self, analysis_id: str, char_freq: Dict[str, int]) -> None:
+        columns = {char: self._column_for(char) for char in char_freq}
+        self._reserve(len(self._ids) + 1, self.hash_buckets + len(self._columns))
+
+        row = self._rows.get(analysis_id)
+        if row is None:
+            row = len(self._ids)
+            self._ids.append(analysis_id)
+            self._rows[analysis_id] = row
+
+        vector = self._matrix[row]
+        vector[:] = 0
+        total = sum(char_freq.values())
+        if total:
+            for char, count in char_freq.items():
+                vector[columns[char]] += count / total
+        self._norms[row] = np.sqrt(np.dot(vector, vector))
+        if self._centroids is not None:
+            self._partitions[row] = self._nearest_partitions(vector[None, :], 1)[0, 0]
+
+    def _remove(self, analysis_id: str) -> None:
+        row = self._rows.pop(analysis_id, None)
+        if row is None:
+            return
+        last = len(self._ids) - 1
+        if row != last:
+            # Keep rows dense by moving the last row into the freed slot
+            moved_id = self._ids[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+            self._matrix[row] = self._matrix[last]
+            self._norms[row] = self._norms[last]
+            self._partitions[row] = self._partitions[last]
+        self._ids.pop()
+        self._matrix[last] = 0
+        self._norms[last] = 0
+
+    def _reserve(self, rows: int, columns: int) -> None:
+        capacity_rows, capacity_columns = self._matrix.shape
+        if rows <= capacity_rows and columns <= capacity_columns:
+            return
+        new_rows = max(rows, capacity_rows * 2 if rows > capacity_rows else capacity_rows, 16)
+        new_columns = min(
+            max(columns, capacity_columns * 2 if columns > capacity_columns else capacity_columns, 16),
+            self.max_characters + self.hash_buckets
+        )
+
+        matrix = np.zeros((new_rows, new_columns), dtype=np.float32)
+        matrix[:capacity_rows, :capacity_columns] = self._matrix
+        self._matrix = matrix
+
+        norms = np.zeros(new_rows, dtype=np.float32)
+        norms[:capacity_rows] = self._norms
+        self._norms = norms
+
+        partitions = np.zeros(new_rows, dtype=np.int32)
+        partitions[:capacity_rows] = self._partitions
+        self._partitions = partitions
+
+        if self._centroids is not None and new_columns > self._centroids.shape[1]:
+            centroids = np.zeros((len(self._centroids), new_columns), dtype=np.float32)
+            centroids[:, :self._centroids.shape[1]] = self._centroids
+            self._centroids = centroids
+
+    def _unit_rows(self, rows: np.ndarray) -> np.ndarray:
+        block = self._matrix[rows]
+        norms = self._norms[rows][:, None]
+        return np.divide(block, norms, out=np.zeros_like(block), where=norms > 0)
+
+    def _nearest_partitions(self, vectors: np.ndarray, count: int) -> np.ndarray:
+        similarities = vectors @ self._centroids.T
+        if count >= similarities.shape[1]:
+            return np.argsort(-similarities, axis=1)
+        return np.argpartition(-similarities, count - 1, axis=1)[:, :count]
+
+    def _ensure_partitions(self) -> None:
+        size = len(self._ids)
+        if self._centroids is not None and self._trained_size / 2 <= size <= self._trained_size * 2:
+            return
+
+        # Spherical k-means over a sample, then assign every row
+        n_partitions = max(1, int(np.sqrt(size)))
+        rng = np.random.default_rng(0)
+        sample_size = min(size, n_partitions * self._KMEANS_SAMPLE_PER_PARTITION)
+        sample = self._unit_rows(np.sort(rng.choice(size, sample_size, replace=False)))
+        centroids = sample[rng.choice(sample_size, n_partitions, replace=False)]
+        for _ in range(self._KMEANS_ITERATIONS):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+        self._centroids = centroids.astype(np.float32)
+
+        for start in range(0, size, self._BLOCK_ROWS):
+            rows = np.arange(start, min(start + self._BLOCK_ROWS, size))
+            self._partitions[rows] = np.argmax(self._unit_rows(rows) @ self._centroids.T, axis=1)
+        self._trained_size = size
+        logger.info(f"📐 Trained {n_partitions} similarity partitions over {size} strings")
+
+    def _candidate_rows(self, query_vector: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(query_vector)
+        unit = query_vector / norm if norm > 0 else query_vector
+        probes = self._nearest_partitions(unit[None, :], self.n_probe)[0]
+        return np.flatnonzero(np.isin(self._partitions[:len(self._ids)], probes))
+
+
+character_index = CharacterFrequencyIndex(
+    approximate_threshold=settings.similarity_approximate_threshold,
+    n_probe=settings.similarity_n_probe,
+    max_characters=settings.similarity_max_characters,
+    hash_buckets=settings.similarity_hash_buckets
+)
@@ -1,12 +1,17 @@
 
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
+from app import crud
 from app.main import app
+from app.natural_language import NaturalLanguageParser
 from app.database import get_db
-from app.models import Base
+from app.models import Base, StringAnalysis
+from app.similarity import CharacterFrequencyIndex, character_index
+from app.partitioning import PartitionedSession, partition_for_hash
 
 # Test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -27,6 +32,7 @@ client = TestClient(app)
 @pytest.fixture()
 def test_db():
     Base.metadata.create_all(bind=engine)
+    character_index.clear()
     yield
     Base.metadata.drop_all(bind=engine)
 
@@ -52,6 +58,15 @@ def test_get_string(test_db):
     data = response.json()
     assert data["value"] == "test string"
 
+def test_pagination_order(test_db):
+    for value in ["one", "two", "three", "four", "five"]:
+        client.post("/strings", json={"value": value})
+    
+    pages = [client.get(f"/strings?skip={skip}&limit=2").json()["data"] for skip in (0, 2, 4)]
+    items = [item for page in pages for item in page]
+    assert len({item["id"] for item in items}) == 5
+    assert [(item["created_at"], item["id"]) for item in items] == sorted((item["created_at"], item["id"]) for item in items)
+
 def test_natural_language_query(test_db):
     # Create some test data
     client.post("/strings", json={"value": "madam"})
@@ -60,4 +75,185 @@ def test_natural_language_query(test_db):
     response = client.get("/strings/filter-by-natural-language?query=palindromic strings")
     assert response.status_code == 200
     data = response.json()
-    assert "interpreted_query" in data
\ No newline at end of file
+    assert "interpreted_query" in data
+
+def test_similar_strings(test_db):
+    client.post("/strings", json={"value": "listen"})
+    client.post("/strings", json={"value": "xyz"})
+    
+    response = client.get("/strings/similar?query=silent&k=2")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["data"][0]["value"] == "listen"
+    assert all(0.0 <= item["score"] <= 1.0 for item in data["data"])
+    assert data["data"][0]["score"] > data["data"][1]["score"]
+    
+    # Deleted strings drop out of the index
+    client.delete("/strings/listen")
+    response = client.get("/strings/similar?query=silent&metric=l1")
+    assert [item["value"] for item in response.json()["data"]] == ["xyz"]
+
+def test_similarity_vocabulary_cap(test_db):
+    client.post("/strings", json={"value": "aab"})
+    client.post("/strings", json={"value": "abc"})
+    client.post("/strings", json={"value": "xyz"})
+    client.post("/strings", json={"value": "uvw"})
+    
+    index = CharacterFrequencyIndex(max_characters=2, hash_buckets=16)
+    with TestingSessionLocal() as db:
+        matches, _ = index.query(db, {"x": 1, "y": 1, "z": 1}, k=2)
+    
+    # "a" and "b" keep columns, everything else is hashed into 16 buckets
+    assert index._matrix.shape[1] == 18
+    assert matches[0][1] == pytest.approx(1.0)
+    # Rare-character strings no longer collapse onto each other
+    assert matches[1][1] < 0.9
+
+def test_lookup_and_bulk_delete(test_db):
+    for value in ["madam", "racecar", "hello world", "abc", "xyz"]:
+        client.post("/strings", json={"value": value})
+    
+    hello_hash = client.get("/strings/hello world").json()["id"]
+    response = client.post("/strings/lookup", json={"values": ["madam", "missing"], "hashes": [hello_hash]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["count"] == 2
+    assert data["not_found"] == {"values": ["missing"], "hashes": []}
+    
+    def similar_values():
+        response = client.get("/strings/similar?query=abc&k=10")
+        return {item["value"] for item in response.json()["data"]}
+    
+    assert similar_values() == {"madam", "racecar", "hello world", "abc", "xyz"}
+    
+    # Small delete: rows are removed from the loaded similarity index one by one
+    response = client.post("/strings/bulk-delete", json={"values": ["abc"]})
+    assert response.json()["count"] == 1
+    assert similar_values() == {"madam", "racecar", "hello world", "xyz"}
+    
+    # Large delete: the index is reset and reloads on the next query
+    response = client.post("/strings/bulk-delete", json={"filters": {"is_palindrome": True}})
+    assert response.status_code == 200
+    assert response.json()["count"] == 2
+    assert client.get("/strings").json()["count"] == 2
+    assert similar_values() == {"hello world", "xyz"}
+    
+    response = client.post("/strings/bulk-delete", json={})
+    assert response.status_code == 400
+
+def test_natural_language_batch(test_db):
+    client.post("/strings", json={"value": "madam"})
+    client.post("/strings", json={"value": "hello world"})
+    
+    response = client.post(
+        "/strings/filter-by-natural-language/batch",
+        json={"queries": [
+            "palindromic strings",
+            "all single word palindromic strings",
+            "strings with two words",
+            "strings longer than 10 characters shorter than 5 characters"
+        ]}
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["count"] for result in results[:3]] == [1, 1, 1]
+    assert results[0]["data"][0]["value"] == "madam"
+    assert results[2]["data"][0]["value"] == "hello world"
+    assert results[3]["error"] is not None
+
+
+# Three SQLite files standing in for Postgres partitions
+partition_engines = [
+    create_engine(f"sqlite:///./test_partition_{index}.db", connect_args={"check_same_thread": False})
+    for index in range(3)
+]
+PartitionSessionLocals = [sessionmaker(autocommit=False, autoflush=False, bind=e) for e in partition_engines]
+
+@pytest.fixture()
+def partitioned_db():
+    executor = ThreadPoolExecutor(max_workers=3)
+    
+    def override_get_partitioned_db():
+        db = PartitionedSession(PartitionSessionLocals, executor)
+        try:
+            yield db
+        finally:
+            db.close()
+    
+    for partition_engine in partition_engines:
+        Base.metadata.create_all(bind=partition_engine)
+    character_index.clear()
+    app.dependency_overrides[get_db] = override_get_partitioned_db
+    yield
+    app.dependency_overrides[get_db] = override_get_db
+    for partition_engine in partition_engines:
+        Base.metadata.drop_all(bind=partition_engine)
+    executor.shutdown()
+
+def test_partitioned_storage(partitioned_db):
+    values = ["madam", "stats", "civic", "noon", "hello world", "test string", "foo", "python"]
+    ids = [client.post("/strings", json={"value": value}).json()["id"] for value in values]
+    
+    # Rows land only in the partition their hash routes to
+    for analysis_id in ids:
+        partition = partition_for_hash(analysis_id, 3)
+        for index, session_local in enumerate(PartitionSessionLocals):
+            with session_local() as session:
+                assert (session.get(StringAnalysis, analysis_id) is not None) == (index == partition)
+    
+    assert client.get("/strings/noon").json()["value"] == "noon"
+    
+    # Pages merged across partitions cover every row exactly once
+    pages = [client.get(f"/strings?skip={skip}&limit=3").json() for skip in (0, 3, 6)]
+    assert all(page["count"] == len(values) for page in pages)
+    assert sorted(item["value"] for page in pages for item in page["data"]) == sorted(values)
+    
+    assert client.get("/strings?is_palindrome=true").json()["count"] == 4
+    
+    response = client.post("/strings/lookup", json={"values": ["madam", "python", "missing"]})
+    assert response.json()["count"] == 2
+    
+    # Hashes that cannot be routed to a partition are rejected up front
+    assert client.post("/strings/lookup", json={"hashes": ["not-a-hash"]}).status_code == 422
+    assert client.post("/strings/lookup", json={"hashes": [""]}).status_code == 422
+    assert client.post("/strings/bulk-delete", json={"hashes": ["zz"]}).status_code == 422
+    
+    response = client.post("/strings/filter-by-natural-language/batch", json={"queries": ["palindromic strings", "strings with two words"]})
+    assert [result["count"] for result in response.json()["results"]] == [4, 2]
+    
+    response = client.post("/strings/bulk-delete", json={"filters": {"is_palindrome": True}})
+    assert response.json()["count"] == 4
+    assert client.get("/strings").json()["count"] == 4
+    assert client.delete("/strings/foo").status_code == 204
+    assert client.get("/strings/foo").status_code == 404
+def test_partitioned_pages_match_single_database(test_db, partitioned_db):
+    values = ["madam", "stats", "civic", "noon", "hello world", "test string", "foo", "python", "level", "one two"]
+    for value in values:
+        client.post("/strings", json={"value": value})
+    
+    # Copy the partitioned rows, created_at included, into the single database
+    with TestingSessionLocal() as single_db:
+        for session_local in PartitionSessionLocals:
+            with session_local() as session:
+                for analysis in session.query(StringAnalysis).all():
+                    session.expunge(analysis)
+                    single_db.merge(analysis)
+        single_db.commit()
+        
+        for skip in (0, 3, 7, 9):
+            expected, expected_count = crud.StringAnalysisCRUD.get_all_analyses(single_db, skip=skip, limit=3)
+            response = client.get(f"/strings?skip={skip}&limit=3").json()
+            assert response["count"] == expected_count
+            assert [item["id"] for item in response["data"]] == [analysis.id for analysis in expected]
+        
+        queries = ["palindromic strings", "strings with two words"]
+        _, expected_pages = crud.StringAnalysisCRUD.get_analyses_for_filter_sets(
+            single_db,
+            [NaturalLanguageParser.parse_query(query) for query in queries],
+            skip=1,
+            limit=2
+        )
+        response = client.post("/strings/filter-by-natural-language/batch", json={"queries": queries, "skip": 1, "limit": 2})
+        for result, (expected, expected_count) in zip(response.json()["results"], expected_pages):
+            assert result["count"] == expected_count
+            assert [item["id"] for item in result["data"]] == [analysis.id for analysis in expected]